@@ -1,20 +1,34 @@
+import time
+_IMPORT_START = time.perf_counter()
+
 import os
-import telebot
-import requests
+import sys
 import re
 import json
 import asyncio
-import aiohttp
-import time
 import threading
+import queue
+import base64
+import hmac
+import shutil
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
 from datetime import datetime
-from dotenv import load_dotenv
 import logging
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from io import BytesIO
 import tempfile
 import urllib.parse
 
+import instagram_parser
+from job_control import (
+    Deadline, DeadlineExceeded, LoadShedder, ResolveCache, ResourceExhausted, ResourceGovernor
+)
+
+# telebot, requests va aiohttp sekin import qilinadi - ular kerak bo'lganda
+# yuklanadi, shunda port cold start'da darhol ochiladi
+
 # Logging sozlash
 logging.basicConfig(
     level=logging.INFO,
@@ -22,19 +36,86 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
+# Startup phase timings (ms)
+STARTUP_TIMINGS = {}
+_ready = threading.Event()
+
 
-# Bot token
+@contextmanager
+def startup_phase(name):
+    """Measure one startup phase and record it in STARTUP_TIMINGS"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_TIMINGS[name] = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"⏱ {name}: {STARTUP_TIMINGS[name]}ms")
+
+
+STARTUP_TIMINGS['imports'] = round((time.perf_counter() - _IMPORT_START) * 1000, 1)
+
+# Load environment variables (mavjud o'zgaruvchilar ustidan yozilmaydi)
+with startup_phase('dotenv'):
+    from dotenv import load_dotenv
+    load_dotenv()
+
+# Bot token (batch CLI uchun shart emas - server ishga tushganda tekshiriladi)
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-if not BOT_TOKEN:
-    logger.error("❌ BOT_TOKEN topilmadi!")
-    exit(1)
 
 # Max video size (150MB)
 MAX_VIDEO_SIZE = 150 * 1024 * 1024  # 150MB in bytes
 
-bot = telebot.TeleBot(BOT_TOKEN, parse_mode="HTML")
+# Resource budgets (bir vaqtda ishlayotgan barcha joblar uchun)
+MAX_INFLIGHT_BYTES = int(os.getenv("MAX_INFLIGHT_BYTES", 2 * MAX_VIDEO_SIZE))
+MAX_SCRATCH_BYTES = int(os.getenv("MAX_SCRATCH_BYTES", 4 * MAX_VIDEO_SIZE))
+MAX_OPEN_FDS = int(os.getenv("MAX_OPEN_FDS", 64))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", 20))
+ADMISSION_TIMEOUT = float(os.getenv("ADMISSION_TIMEOUT", 60))
+
+# Bitta job uchun umumiy vaqt (resolve + download + upload), soniya
+JOB_DEADLINE = float(os.getenv("JOB_DEADLINE", 120))
+# Job ichidagi bitta Telegram chaqiruvi (xabar, tahrir, preview) uchun maksimal vaqt
+TELEGRAM_CALL_TIMEOUT = 10
+# Deadline'dan shuncha vaqtdan kam qolsa preview yuborilmaydi
+PREVIEW_MIN_BUDGET = 20
+
+# Yuklangan videolar file_id keshi (shortcode -> file_id)
+FILE_ID_CACHE_SIZE = int(os.getenv("FILE_ID_CACHE_SIZE", 10000))
+
+# Aniqlangan video manzillari keshi (Instagram CDN linklari eskiradi)
+RESOLVE_CACHE_TTL = int(os.getenv("RESOLVE_CACHE_TTL", 600))
+RESOLVE_NEGATIVE_TTL = int(os.getenv("RESOLVE_NEGATIVE_TTL", 60))
+RESOLVE_CACHE_SIZE = int(os.getenv("RESOLVE_CACHE_SIZE", 5000))
+# Umumiy (coalesced) resolve'ning o'z vaqt chegarasi - hech bir job deadline'iga bog'liq emas
+RESOLVE_TIMEOUT = float(os.getenv("RESOLVE_TIMEOUT", 30))
+
+# Inline mode: Telegram javobni bir necha soniya ichida kutadi
+INLINE_TIMEOUT = float(os.getenv("INLINE_TIMEOUT", 8))
+INLINE_ANSWER_MARGIN = 1.0  # answer_inline_query uchun qoldiriladigan vaqt
+INLINE_MAX_URL_SIZE = 20 * 1024 * 1024  # URL orqali video yuborish limiti
+
+# Batch API (BATCH_API_KEY bo'lmasa endpoint o'chiq)
+BATCH_API_KEY = os.getenv("BATCH_API_KEY")
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 5000))
+BATCH_MAX_PARALLELISM = int(os.getenv("BATCH_MAX_PARALLELISM", 8))
+
+# Download socket + temp file + upload socket
+JOB_FDS = 3
+# Resolve, HEAD probe va preview bosqichlari bir vaqtda bitta socket ochadi
+STAGE_FDS = 1
+
+# Bir vaqtda ishlaydigan inline thread'lar (har bir harf uchun so'rov keladi)
+INLINE_MAX_WORKERS = int(os.getenv("INLINE_MAX_WORKERS", 16))
+
+# Fayllarni o'qish/base64 qilish bo'lagi (3 ga karrali - base64 bo'laklari ulanganda to'g'ri qoladi)
+STREAM_CHUNK_SIZE = 3 * 64 * 1024
+
+# Fast start: avval portni ochish, keyin bot va webhook'ni fonda tayyorlash
+FAST_START = os.getenv("FAST_START", "1") == "1"
+
+# TeleBot birinchi ishlatilganda yaratiladi (get_bot)
+bot = None
+_bot_lock = threading.Lock()
 
 # Flask app
 app = Flask(__name__)
@@ -44,6 +125,105 @@ RENDER_EXTERNAL_URL = os.getenv('RENDER_EXTERNAL_URL', 'https://telegram-bot-cic
 WEBHOOK_URL = f"{RENDER_EXTERNAL_URL}/{BOT_TOKEN}"
 
 
+def get_bot():
+    """Create the TeleBot instance on first use"""
+    global bot
+    if bot is None:
+        if not BOT_TOKEN:
+            raise RuntimeError("BOT_TOKEN topilmadi")
+        with _bot_lock:
+            if bot is None:
+                with startup_phase('telebot'):
+                    import telebot
+                    new_bot = telebot.TeleBot(BOT_TOKEN, parse_mode="HTML")
+                    register_handlers(new_bot)
+                bot = new_bot
+    return bot
+
+
+def ensure_webhook(force=False):
+    """Set webhook only if Telegram has a different URL (or force=True)"""
+    telegram_bot = get_bot()
+    if not force:
+        info = telegram_bot.get_webhook_info()
+        if info.url == WEBHOOK_URL:
+            logger.info("✅ Webhook already up to date")
+            return False
+
+    telegram_bot.set_webhook(url=WEBHOOK_URL)
+    logger.info("✅ Webhook set successfully!")
+    return True
+
+
+def warm_up():
+    """Load heavy modules, create the bot and check the webhook"""
+    start = time.perf_counter()
+
+    with startup_phase('lazy_imports'):
+        import requests
+        import aiohttp
+
+    get_bot()
+
+    with startup_phase('webhook'):
+        try:
+            ensure_webhook()
+        except Exception as e:
+            logger.error(f"❌ Webhook error: {e}")
+
+    STARTUP_TIMINGS['warm_up'] = round((time.perf_counter() - start) * 1000, 1)
+    _ready.set()
+    logger.info(f"🚀 Bot ready, startup timings: {STARTUP_TIMINGS}")
+
+
+# ==================== RESOURCE GOVERNOR ====================
+
+governor = ResourceGovernor(
+    MAX_INFLIGHT_BYTES,
+    MAX_SCRATCH_BYTES,
+    MAX_OPEN_FDS,
+    MAX_QUEUED_JOBS,
+    typical_job={'memory': MAX_VIDEO_SIZE, 'disk': MAX_VIDEO_SIZE, 'fds': JOB_FDS},
+    admission_timeout=ADMISSION_TIMEOUT
+)
+
+
+# ==================== DEADLINES ====================
+
+shedder = LoadShedder(governor, JOB_DEADLINE, ADMISSION_TIMEOUT)
+
+
+# ==================== FILE ID CACHE ====================
+
+class FileIdCache:
+    """LRU map of shortcode -> Telegram file_id of an already uploaded video"""
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, shortcode):
+        with self._lock:
+            file_id = self._items.get(shortcode)
+            if file_id:
+                self._items.move_to_end(shortcode)
+            return file_id
+
+    def set(self, shortcode, file_id):
+        with self._lock:
+            self._items[shortcode] = file_id
+            self._items.move_to_end(shortcode)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+file_id_cache = FileIdCache(FILE_ID_CACHE_SIZE)
+
+
 # ==================== INSTAGRAM DOWNLOADER ====================
 
 class InstagramDownloader:
@@ -92,8 +272,8 @@ class InstagramDownloader:
                 return match.group(1)
         return None
 
-    async def get_video_url_async(self, shortcode):
-        """Get video URL using multiple methods"""
+    async def get_media_async(self, shortcode, deadline=None):
+        """Get media record (video URL + metadata) using multiple methods"""
 
         methods = [
             self._method_graphql,
@@ -104,159 +284,105 @@ class InstagramDownloader:
         ]
 
         for method in methods:
+            timeout = deadline.timeout(10, 'resolve') if deadline else 10
             try:
-                video_url, caption = await method(shortcode)
-                if video_url:
+                record = await method(shortcode, timeout)
+                if record.video_url:
                     logger.info(f"✅ Method success: {method.__name__}")
-                    return video_url, caption
+                    record.shortcode = shortcode
+                    return record
+            except instagram_parser.ParseError as e:
+                instagram_parser.record_failure(method.__name__, e.kind)
+                if e.kind == instagram_parser.SCHEMA_CHANGED:
+                    logger.warning(f"⚠️ Method {method.__name__}: response schema changed ({e})")
+                else:
+                    logger.info(f"Method {method.__name__} failed: {e.kind}")
             except Exception as e:
+                instagram_parser.record_failure(method.__name__, 'error')
                 logger.debug(f"Method {method.__name__} failed: {e}")
-                continue
 
-        return None, "Video topilmadi"
+        return None
 
-    async def _method_graphql(self, shortcode):
-        """Method 1: GraphQL API"""
-        url = f"https://www.instagram.com/p/{shortcode}/?__a=1&__d=dis"
+    async def _fetch_text(self, url, timeout=10):
+        """GET url, return (status, body text)"""
+        import aiohttp
         headers = self.get_random_headers()
 
         async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-
-                    # Try different response structures
-                    video_url = None
-                    caption = ""
-
-                    # New structure
-                    if 'items' in data and len(data['items']) > 0:
-                        item = data['items'][0]
-                        if 'video_versions' in item:
-                            video_url = item['video_versions'][0]['url']
-                        caption = item.get('caption', {}).get('text', '')
-
-                    # Old structure
-                    elif 'graphql' in data:
-                        media = data['graphql']['shortcode_media']
-                        if media.get('is_video'):
-                            video_url = media.get('video_url')
-                            if 'edge_media_to_caption' in media:
-                                edges = media['edge_media_to_caption']['edges']
-                                if edges:
-                                    caption = edges[0]['node']['text']
-
-                    if video_url:
-                        return video_url, caption
-
-        return None, ""
-
-    async def _method_embed(self, shortcode):
-        """Method 2: Embed page"""
-        url = f"https://www.instagram.com/p/{shortcode}/embed/captioned/"
-        headers = self.get_random_headers()
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                return response.status, await response.text()
 
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    html = await response.text()
-
-                    # Look for video URL in embed
-                    patterns = [
-                        r'src="([^"]+\.mp4[^"]*)"',
-                        r'video_url":"([^"]+)"',
-                        r'content="([^"]+\.mp4[^"]*)"',
-                        r'videoSrc":"([^"]+)"'
-                    ]
-
-                    for pattern in patterns:
-                        match = re.search(pattern, html)
-                        if match:
-                            video_url = match.group(1)
-                            video_url = video_url.replace('\\u0026', '&')
-                            return video_url, "Instagram video"
-
-        return None, ""
-
-    async def _method_oembed(self, shortcode):
-        """Method 3: OEmbed API"""
-        url = f"https://www.instagram.com/p/{shortcode}/"
-        oembed_url = f"https://api.instagram.com/oembed/?url={urllib.parse.quote(url)}"
-        headers = self.get_random_headers()
+    async def _method_graphql(self, shortcode, timeout=10):
+        """Method 1: GraphQL API"""
+        status, text = await self._fetch_text(f"https://www.instagram.com/p/{shortcode}/?__a=1&__d=dis", timeout)
+        return instagram_parser.parse_graphql(status, text)
 
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(oembed_url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    # OEmbed only gives metadata, need another method for actual video
-                    return None, data.get('title', '')
+    async def _method_embed(self, shortcode, timeout=10):
+        """Method 2: Embed page"""
+        status, html = await self._fetch_text(f"https://www.instagram.com/p/{shortcode}/embed/captioned/", timeout)
+        return instagram_parser.parse_embed(status, html)
 
-        return None, ""
+    async def _method_oembed(self, shortcode, timeout=10):
+        """Method 3: OEmbed API (metadata only, need another method for actual video)"""
+        url = f"https://www.instagram.com/p/{shortcode}/"
+        status, text = await self._fetch_text(f"https://api.instagram.com/oembed/?url={urllib.parse.quote(url)}", timeout)
+        return instagram_parser.parse_oembed(status, text)
 
-    async def _method_ddinstagram(self, shortcode):
+    async def _method_ddinstagram(self, shortcode, timeout=10):
         """Method 4: ddinstagram.com (alternative frontend)"""
-        url = f"https://www.ddinstagram.com/p/{shortcode}"
-        headers = self.get_random_headers()
-
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    html = await response.text()
-
-                    # Look for video
-                    patterns = [
-                        r'<video[^>]+src="([^"]+)"',
-                        r'src="([^"]+\.mp4)"'
-                    ]
+        status, html = await self._fetch_text(f"https://www.ddinstagram.com/p/{shortcode}", timeout)
+        return instagram_parser.parse_ddinstagram(status, html)
 
-                    for pattern in patterns:
-                        match = re.search(pattern, html)
-                        if match:
-                            return match.group(1), "Instagram video"
-
-        return None, ""
-
-    async def _method_bibliogram(self, shortcode):
+    async def _method_bibliogram(self, shortcode, timeout=10):
         """Method 5: Bibliogram (alternative frontend)"""
-        url = f"https://bibliogram.art/p/{shortcode}"
-        headers = self.get_random_headers()
+        status, html = await self._fetch_text(f"https://bibliogram.art/p/{shortcode}", timeout)
+        return instagram_parser.parse_bibliogram(status, html)
 
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    html = await response.text()
-
-                    # Bibliogram specific parsing
-                    if 'video' in html.lower():
-                        # Try to find video source
-                        patterns = [
-                            r'<source[^>]+src="([^"]+)"',
-                            r'src="([^"]+/video/[^"]+)"'
-                        ]
-
-                        for pattern in patterns:
-                            match = re.search(pattern, html)
-                            if match:
-                                return match.group(1), "Instagram video"
-
-        return None, ""
-
-    def download_video(self, video_url, max_size=MAX_VIDEO_SIZE):
-        """Download video with progress and size check"""
+    def download_thumbnail(self, thumbnail_url, max_size=200 * 1024, timeout=5):
+        """Download a small JPEG thumbnail for send_video (Telegram limit 200KB)"""
+        import requests
+        try:
+            response = requests.get(thumbnail_url, headers=self.get_random_headers(), timeout=timeout)
+            if response.status_code == 200 and len(response.content) <= max_size:
+                return response.content
+        except Exception as e:
+            logger.debug(f"Thumbnail download error: {e}")
+        return None
+
+    def probe_video_size(self, video_url, max_size=MAX_VIDEO_SIZE, timeout=10):
+        """Check video size with a HEAD request (None if unknown)"""
+        import requests
         try:
             headers = self.get_random_headers()
+            # ddinstagram/Bibliogram linklari redirect qiladi - 3xx/4xx javobning
+            # Content-Length'i video hajmi emas
+            response_head = requests.head(video_url, headers=headers, timeout=timeout, allow_redirects=True)
+            if response_head.status_code != 200:
+                return None, None
 
-            # First, check size
-            response_head = requests.head(video_url, headers=headers, timeout=10)
             content_length = response_head.headers.get('content-length')
 
-            if content_length:
+            if content_length and int(content_length) > 0:
                 size = int(content_length)
                 if size > max_size:
                     return None, f"Video juda katta ({size // 1024 // 1024}MB). Max: {max_size // 1024 // 1024}MB"
+                return size, None
+
+            return None, None
 
-            # Download with streaming
-            response = requests.get(video_url, headers=headers, stream=True, timeout=30)
+        except Exception as e:
+            logger.warning(f"Size probe error: {e}")
+            return None, None
+
+    def download_video(self, video_url, max_size=MAX_VIDEO_SIZE, deadline=None):
+        """Download video with progress, size and deadline check"""
+        import requests
+        try:
+            headers = self.get_random_headers()
+
+            # Download with streaming (timeout har bir o'qish uchun, umumiy vaqtni deadline cheklaydi)
+            timeout = deadline.timeout(30, 'download') if deadline else 30
+            response = requests.get(video_url, headers=headers, stream=True, timeout=timeout)
 
             if response.status_code == 200:
                 # Create temporary file
@@ -276,6 +402,12 @@ class InstagramDownloader:
                             os.unlink(temp_file.name)
                             return None, f"Video {max_size // 1024 // 1024}MB dan katta"
 
+                        if deadline and deadline.remaining() <= 0:
+                            temp_file.close()
+                            os.unlink(temp_file.name)
+                            response.close()
+                            raise DeadlineExceeded('download')
+
                 temp_file.close()
 
                 # Check final size
@@ -293,6 +425,8 @@ class InstagramDownloader:
             else:
                 return None, f"Download error: {response.status_code}"
 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Download error: {e}")
             return None, str(e)
@@ -302,9 +436,50 @@ class InstagramDownloader:
 downloader = InstagramDownloader()
 
 
+def probe_size(video_url, max_size=MAX_VIDEO_SIZE, timeout=10):
+    """probe_video_size under a one-socket reservation; size unknown if no socket is free"""
+    start = time.monotonic()
+    try:
+        with governor.acquire(fds=STAGE_FDS, timeout=timeout, job=False):
+            return downloader.probe_video_size(
+                video_url,
+                max_size=max_size,
+                timeout=max(0.1, timeout - (time.monotonic() - start))
+            )
+    except ResourceExhausted as e:
+        logger.warning(f"Size probe skipped: {e}")
+        return None, None
+
+
+# ==================== RESOLVE CACHE ====================
+
+def fetch_media(shortcode, deadline):
+    """Resolve one shortcode on a private event loop (ResolveCache worker thread)"""
+    return asyncio.run(downloader.get_media_async(shortcode, deadline))
+
+
+resolve_cache = ResolveCache(
+    fetch_media,
+    RESOLVE_CACHE_TTL,
+    RESOLVE_NEGATIVE_TTL,
+    RESOLVE_CACHE_SIZE,
+    RESOLVE_TIMEOUT,
+    governor=governor,
+    fds=STAGE_FDS
+)
+
+
 # ==================== TELEGRAM BOT HANDLERS ====================
 
-@bot.message_handler(commands=['start', 'help'])
+def register_handlers(telegram_bot):
+    """Attach message handlers (called once from get_bot)"""
+    telegram_bot.register_message_handler(send_welcome, commands=['start', 'help'])
+    telegram_bot.register_message_handler(show_status, commands=['status'])
+    telegram_bot.register_message_handler(show_size_limit, commands=['size'])
+    telegram_bot.register_message_handler(handle_message, func=lambda message: True)
+    telegram_bot.register_inline_handler(handle_inline_query, func=lambda query: True)
+
+
 def send_welcome(message):
     welcome_text = """
 <b>🤖 Instagram Video Yuklovchi Bot</b>
@@ -328,6 +503,7 @@ def send_welcome(message):
 • 150MB gacha videolar
 • Tez yuklash
 • Ko'p usullar
+• Inline rejim: istalgan chatda <code>@bot_username link</code>
 
 📎 <b>Namuna:</b>
 <code>https://instagram.com/p/Cxxxxxx/</code>
@@ -338,7 +514,6 @@ def send_welcome(message):
     bot.reply_to(message, welcome_text)
 
 
-@bot.message_handler(commands=['status'])
 def show_status(message):
     status_text = """
 <b>📊 Bot Status</b>
@@ -352,7 +527,6 @@ def show_status(message):
     bot.reply_to(message, status_text)
 
 
-@bot.message_handler(commands=['size'])
 def show_size_limit(message):
     size_info = """
 <b>📏 Video Hajmi Cheklovlari</b>
@@ -366,14 +540,19 @@ Telegram API limiti: 50MB (botlar uchun 2000MB)</i>
     bot.reply_to(message, size_info)
 
 
-@bot.message_handler(func=lambda message: True)
 def handle_message(message):
     """Asynchronous message handler"""
 
+    # Load shedding: deadline ichida tugata olmaydigan ishni qabul qilmaymiz
+    if not shedder.try_admit():
+        logger.warning(f"⚠️ Job shed for {message.chat.id}, estimate: {shedder.estimate():.0f}s")
+        bot.reply_to(message, "⏳ Bot hozir band, birozdan keyin urinib ko'ring")
+        return
+
     # Start processing in background thread
     thread = threading.Thread(
-        target=process_message,
-        args=(message,),
+        target=run_job,
+        args=(message, Deadline(JOB_DEADLINE)),
         daemon=True
     )
     thread.start()
@@ -382,8 +561,23 @@ def handle_message(message):
     bot.reply_to(message, "🔍 Video qidirilmoqda...")
 
 
-def process_message(message):
-    """Process message in background"""
+def run_job(message, deadline):
+    """Run process_message and report its service time to the load shedder"""
+    service_time = None
+    try:
+        service_time = process_message(message, deadline)
+    finally:
+        shedder.done(service_time)
+
+
+def process_message(message, deadline):
+    """Process message in background
+
+    Returns the service time once the video is sent: seconds from governor
+    admission to the end, without the admission and resolve waits that the
+    load shedder already counts as queue time.
+    """
+    preview_msg = None
     try:
         url = message.text.strip()
         chat_id = message.chat.id
@@ -401,66 +595,178 @@ def process_message(message):
             return
 
         # Send progress message
-        progress_msg = bot.send_message(chat_id, "🔍 Video manzili qidirilmoqda...")
+        progress_msg = bot.send_message(
+            chat_id,
+            "🔍 Video manzili qidirilmoqda...",
+            timeout=deadline.timeout(TELEGRAM_CALL_TIMEOUT, 'notify')
+        )
 
         # Get video URL
-        video_url, caption = asyncio.run(downloader.get_video_url_async(shortcode))
+        try:
+            record = resolve_cache.resolve(shortcode, timeout=deadline.timeout(JOB_DEADLINE, 'resolve'))
+        except FutureTimeout:
+            raise DeadlineExceeded('resolve')
 
-        if not video_url:
+        if not record:
             bot.edit_message_text(
-                f"❌ {caption}",
+                "❌ Video topilmadi",
                 chat_id,
-                progress_msg.message_id
+                progress_msg.message_id,
+                timeout=deadline.timeout(TELEGRAM_CALL_TIMEOUT, 'notify')
             )
             return
 
-        # Update progress
-        bot.edit_message_text(
-            "📥 Video yuklanmoqda... (150MB gacha)",
-            chat_id,
-            progress_msg.message_id
-        )
+        video_url, caption = record.video_url, record.caption
+
+        # Instant preview while the video downloads (vaqt kam qolsa o'tkazib yuboriladi)
+        if record.thumbnail_url and deadline.remaining() >= PREVIEW_MIN_BUDGET:
+            info = [f"👤 {record.owner}"] if record.owner else []
+            if record.duration:
+                info.append(f"⏱ {record.duration // 60}:{record.duration % 60:02d}")
+            try:
+                with governor.acquire(fds=STAGE_FDS, timeout=deadline.timeout(5, 'preview'), job=False):
+                    preview_msg = bot.send_photo(
+                        chat_id,
+                        record.thumbnail_url,
+                        caption="\n".join(info) or None,
+                        reply_to_message_id=message_id,
+                        timeout=deadline.timeout(TELEGRAM_CALL_TIMEOUT, 'preview')
+                    )
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                logger.debug(f"Preview error: {e}")
 
-        # Download video
-        video_path, error = downloader.download_video(video_url)
+        # Check size and reserve capacity before downloading
+        size, error = probe_size(video_url, timeout=deadline.timeout(10, 'probe'))
 
         if error:
             bot.edit_message_text(
                 f"❌ {error}",
                 chat_id,
-                progress_msg.message_id
+                progress_msg.message_id,
+                timeout=deadline.timeout(TELEGRAM_CALL_TIMEOUT, 'notify')
             )
             return
 
-        # Update progress
-        bot.edit_message_text(
-            "📤 Telegram'ga yuborilmoqda...",
-            chat_id,
-            progress_msg.message_id
-        )
+        # Hajmi noma'lum bo'lsa, eng yomon holat uchun joy ajratamiz
+        reserve_bytes = size or MAX_VIDEO_SIZE
 
-        # Get video size
-        file_size = os.path.getsize(video_path)
-        size_mb = file_size / 1024 / 1024
+        try:
+            reservation = governor.acquire(
+                memory=reserve_bytes,
+                disk=reserve_bytes,
+                fds=JOB_FDS,
+                timeout=min(ADMISSION_TIMEOUT, deadline.remaining())
+            )
+        except ResourceExhausted as e:
+            logger.warning(f"Job rejected for {chat_id}: {e}")
+            bot.edit_message_text(
+                f"⏳ {e}",
+                chat_id,
+                progress_msg.message_id,
+                timeout=deadline.timeout(TELEGRAM_CALL_TIMEOUT, 'notify')
+            )
+            return
 
-        # Send video to Telegram
-        with open(video_path, 'rb') as video_file:
-            bot.send_video(
+        with reservation:
+            # Update progress
+            bot.edit_message_text(
+                "📥 Video yuklanmoqda... (150MB gacha)",
                 chat_id,
-                video_file,
-                caption=f"{caption[:500]}\n\n📏 Hajmi: {size_mb:.1f}MB" if caption else f"📹 Instagram video\n📏 Hajmi: {size_mb:.1f}MB",
-                reply_to_message_id=message_id,
-                supports_streaming=True,
-                timeout=60
+                progress_msg.message_id,
+                timeout=deadline.timeout(TELEGRAM_CALL_TIMEOUT, 'notify')
             )
 
-        # Delete progress message
-        bot.delete_message(chat_id, progress_msg.message_id)
+            # Download video (ajratilgan hajmdan oshsa to'xtatiladi)
+            video_path, error = downloader.download_video(video_url, max_size=reserve_bytes, deadline=deadline)
 
-        # Clean up temp file
-        os.unlink(video_path)
+            if error:
+                bot.edit_message_text(
+                    f"❌ {error}",
+                    chat_id,
+                    progress_msg.message_id,
+                    timeout=deadline.timeout(TELEGRAM_CALL_TIMEOUT, 'notify')
+                )
+                return
+
+            try:
+                # Update progress
+                bot.edit_message_text(
+                    "📤 Telegram'ga yuborilmoqda...",
+                    chat_id,
+                    progress_msg.message_id,
+                    timeout=deadline.timeout(TELEGRAM_CALL_TIMEOUT, 'notify')
+                )
+
+                # Get video size
+                file_size = os.path.getsize(video_path)
+                size_mb = file_size / 1024 / 1024
+
+                # Metadata lets Telegram render and stream without probing the file
+                thumb = None
+                if record.thumb_url:
+                    thumb = downloader.download_thumbnail(
+                        record.thumb_url,
+                        timeout=deadline.timeout(5, 'thumbnail')
+                    )
+
+                # Send video to Telegram. send_video'ning timeout'i har bir o'qish uchun,
+                # shuning uchun umumiy vaqtni yuklashni kutish orqali cheklaymiz
+                upload_budget = deadline.timeout(JOB_DEADLINE, 'upload')
+                video_file = open(video_path, 'rb')
+                upload = Future()
+
+                def send():
+                    try:
+                        sent = bot.send_video(
+                            chat_id,
+                            video_file,
+                            caption=f"{caption[:500]}\n\n📏 Hajmi: {size_mb:.1f}MB" if caption else f"📹 Instagram video\n📏 Hajmi: {size_mb:.1f}MB",
+                            reply_to_message_id=message_id,
+                            supports_streaming=True,
+                            duration=record.duration,
+                            width=record.width,
+                            height=record.height,
+                            thumb=thumb,
+                            timeout=60
+                        )
+                        if getattr(sent, 'video', None):
+                            file_id_cache.set(shortcode, sent.video.file_id)
+                        upload.set_result(sent)
+                    except Exception as e:
+                        upload.set_exception(e)
+                    finally:
+                        video_file.close()
+
+                threading.Thread(target=send, daemon=True).start()
+
+                try:
+                    upload.result(timeout=upload_budget)
+                except FutureTimeout:
+                    # Boshlangan yuklashni to'xtatib bo'lmaydi - tugaguncha resurslar band qoladi
+                    reservation.hand_off(upload)
+                    raise DeadlineExceeded('upload')
+
+                # Delete progress message (video allaqachon yetkazilgan - deadline bilan bog'lanmaydi)
+                bot.delete_message(chat_id, progress_msg.message_id, timeout=TELEGRAM_CALL_TIMEOUT)
+
+            finally:
+                # Clean up temp file
+                os.unlink(video_path)
 
         logger.info(f"✅ Video sent to {chat_id}, size: {size_mb:.1f}MB")
+        return time.monotonic() - reservation.acquired_at
+
+    except DeadlineExceeded as e:
+        logger.warning(f"⏱ Job deadline exceeded at stage '{e}' for {message.chat.id}")
+        try:
+            bot.send_message(
+                message.chat.id,
+                "⏱ Video belgilangan vaqtda yuklanmadi. Birozdan keyin qayta urinib ko'ring."
+            )
+        except:
+            pass
 
     except Exception as e:
         logger.error(f"Error processing message: {e}")
@@ -472,6 +778,322 @@ def process_message(message):
         except:
             pass
 
+    finally:
+        # Preview faqat video kelguncha kerak - muvaffaqiyat ham, xato ham
+        if preview_msg:
+            try:
+                bot.delete_message(message.chat.id, preview_msg.message_id)
+            except Exception as e:
+                logger.debug(f"Preview delete error: {e}")
+
+
+inline_slots = threading.BoundedSemaphore(INLINE_MAX_WORKERS)
+
+
+def handle_inline_query(inline_query):
+    """Inline mode: @bot <instagram link>"""
+
+    # Thread'lar soni cheklangan; band bo'lsa so'rov tashlanadi - keyingi harf yangi so'rov yuboradi
+    if not inline_slots.acquire(blocking=False):
+        logger.info(f"⏳ Inline query dropped, {INLINE_MAX_WORKERS} workers busy")
+        return
+
+    # Webhook worker'larini band qilmaslik uchun alohida thread
+    thread = threading.Thread(
+        target=run_inline_query,
+        args=(inline_query,),
+        daemon=True
+    )
+    thread.start()
+
+
+def run_inline_query(inline_query):
+    try:
+        process_inline_query(inline_query)
+    finally:
+        inline_slots.release()
+
+
+def process_inline_query(inline_query):
+    """Answer an inline query from the file_id / resolve caches"""
+    from telebot import types
+
+    # Butun javob (resolve + HEAD) uchun umumiy vaqt
+    budget = Deadline(INLINE_TIMEOUT - INLINE_ANSWER_MARGIN)
+
+    try:
+        # Faqat haqiqiy Instagram linklari - oddiy matn har harfda resolve boshlamasin
+        shortcode = downloader.extract_shortcode(inline_query.query)
+
+        # Har bir harf uchun so'rov keladi - chala linklarni resolve qilmaymiz
+        if not shortcode or len(shortcode) < 11:
+            bot.answer_inline_query(inline_query.id, [], cache_time=1)
+            return
+
+        record = resolve_cache.peek(shortcode)
+        caption = (record.caption if record else "")[:1000] or "📹 Instagram video"
+
+        file_id = file_id_cache.get(shortcode)
+        if file_id:
+            result = types.InlineQueryResultCachedVideo(shortcode, file_id, "📹 Instagram video", caption=caption)
+            bot.answer_inline_query(inline_query.id, [result], cache_time=3600)
+            return
+
+        try:
+            record = resolve_cache.resolve(shortcode, timeout=budget.remaining())
+        except FutureTimeout:
+            # Resolve fonda davom etadi, keyingi so'rov keshdan javob oladi
+            logger.info(f"⏳ Inline resolve timeout: {shortcode}")
+            record = None
+        except Exception as e:
+            logger.info(f"Inline resolve failed for {shortcode}: {e}")
+            record = None
+
+        results = []
+        if record:
+            # HEAD faqat qolgan vaqt ichida; vaqt tugasa "botga yuborish" javobi
+            if not record.size and budget.remaining() > 0:
+                size, _ = probe_size(
+                    record.video_url,
+                    max_size=sys.maxsize,
+                    timeout=budget.remaining()
+                )
+                # Faqat redirectdan keyingi 200 javobning musbat hajmi saqlanadi,
+                # 0 yoki xato javob "noma'lum" bo'lib qoladi va keyingi so'rovda qayta tekshiriladi
+                if size and size > 0:
+                    record.size = size
+
+            # Hajmi noma'lum video URL orqali yuborilmaydi - Telegram 20MB dan kattasini rad etadi
+            if record.size and 0 < record.size <= INLINE_MAX_URL_SIZE:
+                results.append(types.InlineQueryResultVideo(
+                    shortcode,
+                    record.video_url,
+                    "video/mp4",
+                    record.thumbnail_url or f"https://www.instagram.com/p/{shortcode}/media/?size=t",
+                    "📹 Instagram video",
+                    caption=record.caption[:1000] or "📹 Instagram video",
+                    video_width=record.width,
+                    video_height=record.height,
+                    video_duration=record.duration,
+                    description=f"👤 {record.owner}" if record.owner else None
+                ))
+
+        if results:
+            bot.answer_inline_query(inline_query.id, results, cache_time=300)
+        else:
+            # Katta yoki hali tayyor bo'lmagan video - botga yuborishni taklif qilamiz
+            bot.answer_inline_query(
+                inline_query.id,
+                [],
+                cache_time=1,
+                switch_pm_text="📩 Botga yuborib yuklab olish",
+                switch_pm_parameter="start"
+            )
+
+    except Exception as e:
+        logger.error(f"Inline query error: {e}")
+
+
+# ==================== BATCH API ====================
+
+def resolve_input(item):
+    """Shortcode from an Instagram URL or a bare shortcode"""
+    item = str(item).strip()
+    shortcode = downloader.extract_shortcode(item)
+    if shortcode:
+        return shortcode
+    if re.fullmatch(r'[A-Za-z0-9_-]{5,40}', item):
+        return item
+    return None
+
+
+@contextmanager
+def downloaded_video(video_url, size):
+    """Download a video to a temp file under a governor reservation, yields (path, error)
+
+    The file is only ever read in STREAM_CHUNK_SIZE pieces, so the reservation
+    holds scratch disk for the whole video but memory for a couple of chunks.
+    """
+    reserve_bytes = size or MAX_VIDEO_SIZE
+
+    try:
+        reservation = governor.acquire(
+            memory=2 * STREAM_CHUNK_SIZE,
+            disk=reserve_bytes,
+            fds=JOB_FDS
+        )
+    except ResourceExhausted as e:
+        yield None, str(e)
+        return
+
+    with reservation:
+        video_path, error = downloader.download_video(video_url, max_size=reserve_bytes)
+        try:
+            yield video_path, error
+        finally:
+            if video_path and os.path.exists(video_path):
+                os.unlink(video_path)
+
+
+def stream_with_file(result):
+    """NDJSON line for result with the video embedded as base64, streamed in chunks"""
+    with downloaded_video(result["video_url"], result["size"]) as (video_path, error):
+        if error:
+            result.update(ok=False, file_error=error)
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+            return
+
+        line = json.dumps(result, ensure_ascii=False)
+        yield line[:-1] + ', "file_b64": "'
+        with open(video_path, 'rb') as video_file:
+            for chunk in iter(lambda: video_file.read(STREAM_CHUNK_SIZE), b''):
+                yield base64.b64encode(chunk).decode('ascii')
+        yield '"}\n'
+
+
+async def _resolve_batch_item(index, item, semaphore, fetch):
+    """Resolve one batch item; failures are reported, never raised"""
+    result = {"index": index, "input": item, "ok": False}
+
+    try:
+        shortcode = resolve_input(item)
+        if not shortcode:
+            result["error"] = "Noto'g'ri Instagram linki"
+            return result
+
+        result["shortcode"] = shortcode
+        file_id = file_id_cache.get(shortcode)
+        if file_id:
+            result["file_id"] = file_id
+
+        async with semaphore:
+            # Kesh orqali: bir xil shortcode'lar (batch ichida ham, DM/inline bilan ham) bir marta aniqlanadi
+            loop = asyncio.get_running_loop()
+            record = await loop.run_in_executor(None, resolve_cache.resolve, shortcode)
+            if not record:
+                result["error"] = "Video topilmadi"
+                return result
+
+            result.update(record.as_dict())
+            result["ok"] = True
+
+            size, error = await loop.run_in_executor(None, probe_size, record.video_url)
+            result["size"] = size
+            if error:
+                result["size_error"] = error
+            elif fetch:
+                result.update(await loop.run_in_executor(None, fetch, result))
+                if "file_error" in result:
+                    result["ok"] = False
+
+    except Exception as e:
+        logger.warning(f"Batch item {item!r} failed: {e}")
+        result["ok"] = False
+        result["error"] = str(e)[:200]
+
+    return result
+
+
+async def _run_batch(items, parallelism, emit, fetch, stop):
+    semaphore = asyncio.Semaphore(parallelism)
+    tasks = [
+        asyncio.create_task(_resolve_batch_item(index, item, semaphore, fetch))
+        for index, item in enumerate(items)
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            result = await task
+            if stop.is_set():
+                logger.info("📦 Batch stopped: consumer went away")
+                return
+            emit(result)
+    finally:
+        # Navbatdagi elementlar endi hech kimga kerak emas
+        for task in tasks:
+            task.cancel()
+
+
+def iter_batch_results(items, parallelism, fetch=None):
+    """Resolve items concurrently in a worker thread and yield results as they finish
+
+    Closing the generator (e.g. the HTTP client disconnected) stops the worker
+    and cancels the items it has not resolved yet.
+    """
+    results = queue.Queue()
+    done = object()
+    stop = threading.Event()
+
+    def worker():
+        try:
+            asyncio.run(_run_batch(items, parallelism, results.put, fetch, stop))
+        except Exception as e:
+            logger.error(f"Batch error: {e}")
+        finally:
+            results.put(done)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+    try:
+        while True:
+            result = results.get()
+            if result is done:
+                return
+            yield result
+    finally:
+        stop.set()
+
+
+def _check_api_key():
+    auth = request.headers.get('Authorization', '')
+    key = auth[7:] if auth.startswith('Bearer ') else request.headers.get('X-API-Key', '')
+    return hmac.compare_digest(key.encode(), BATCH_API_KEY.encode())
+
+
+def batch_cli(argv):
+    """CLI: python app.py batch [URL|shortcode ...] - NDJSON to stdout"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python app.py batch",
+        description="Instagram videolarini ommaviy aniqlash/yuklash (NDJSON)"
+    )
+    parser.add_argument("inputs", nargs="*", help="URL yoki shortcode'lar (bo'sh bo'lsa stdin'dan o'qiladi)")
+    parser.add_argument("-f", "--file", help="Har qatorda bitta URL/shortcode bo'lgan fayl")
+    parser.add_argument("-p", "--parallelism", type=int, default=BATCH_MAX_PARALLELISM)
+    parser.add_argument("-o", "--output-dir", help="Videolarni shu papkaga saqlash")
+    args = parser.parse_args(argv)
+
+    items = list(args.inputs)
+    if args.file:
+        with open(args.file, encoding='utf-8') as f:
+            items.extend(line.strip() for line in f if line.strip())
+    if not items:
+        items = [line.strip() for line in sys.stdin if line.strip()]
+
+    fetch = None
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+        def save_to_dir(video_path, shortcode):
+            target = os.path.join(args.output_dir, f"{shortcode}.mp4")
+            shutil.move(video_path, target)
+            return {"file": target}
+
+        def fetch(result):
+            with downloaded_video(result["video_url"], result["size"]) as (video_path, error):
+                if error:
+                    return {"file_error": error}
+                return save_to_dir(video_path, result["shortcode"])
+
+    failures = 0
+    for result in iter_batch_results(items, max(1, args.parallelism), fetch=fetch):
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+        if not result["ok"]:
+            failures += 1
+
+    logger.info(f"📦 Batch done: {len(items) - failures}/{len(items)} ok")
+    return 1 if failures else 0
+
 
 # ==================== FLASK ROUTES ====================
 
@@ -526,16 +1148,16 @@ def health():
         "service": "instagram-video-bot",
         "timestamp": datetime.now().isoformat(),
         "max_video_size": "150MB",
-        "version": "2.0"
+        "version": "2.0",
+        "ready": _ready.is_set(),
+        "startup_ms": STARTUP_TIMINGS
     })
 
 
 @app.route('/set_webhook')
 def set_webhook():
     try:
-        bot.remove_webhook()
-        time.sleep(1)
-        bot.set_webhook(url=WEBHOOK_URL)
+        ensure_webhook(force=True)
         return f'''
         <h1>✅ Webhook Set Successfully!</h1>
         <p>URL: {WEBHOOK_URL}</p>
@@ -555,25 +1177,79 @@ def stats():
         "max_video_size_mb": 150,
         "supported_formats": ["mp4", "video"],
         "methods": ["graphql", "embed", "oembed", "ddinstagram", "bibliogram"],
-        "updates": "2025-12-15 - Added 150MB support"
+        "updates": "2025-12-15 - Added 150MB support",
+        "resources": governor.stats(),
+        "cached_file_ids": len(file_id_cache),
+        "cached_resolves": len(resolve_cache),
+        "parse_failures": instagram_parser.failure_stats(),
+        "load": shedder.stats()
     })
 
 
-@app.route(f'/{BOT_TOKEN}', methods=['POST'])
+@app.route('/api/batch', methods=['POST'])
+def batch_download():
+    """Bulk resolve endpoint, streams NDJSON results"""
+    if not BATCH_API_KEY:
+        return jsonify({"error": "Batch API o'chirilgan"}), 403
+    if not _check_api_key():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "JSON obyekt kerak: {\"items\": [...]}"}), 400
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "'items' ro'yxati kerak"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Max {BATCH_MAX_ITEMS} ta element"}), 413
+
+    try:
+        parallelism = int(data.get('parallelism', BATCH_MAX_PARALLELISM))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'parallelism' son bo'lishi kerak"}), 400
+    parallelism = max(1, min(parallelism, BATCH_MAX_PARALLELISM))
+
+    include_files = bool(data.get('include_files'))
+
+    def generate():
+        for result in iter_batch_results(items, parallelism):
+            if include_files and result["ok"] and not result.get("size_error"):
+                # Fayllar javob oqimiga ketma-ket yoziladi, aniqlash parallel qoladi
+                yield from stream_with_file(result)
+            else:
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
 def webhook():
     """Telegram webhook endpoint"""
     if request.headers.get('content-type') == 'application/json':
+        import telebot
         json_string = request.get_data().decode('utf-8')
         update = telebot.types.Update.de_json(json_string)
-        bot.process_new_updates([update])
+        get_bot().process_new_updates([update])
         return 'OK', 200
     else:
         return 'Bad Request', 400
 
 
+if BOT_TOKEN:
+    app.add_url_rule(f'/{BOT_TOKEN}', 'webhook', webhook, methods=['POST'])
+else:
+    logger.warning("⚠️ BOT_TOKEN topilmadi - webhook endpoint o'chirilgan")
+
+
 # ==================== MAIN ====================
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        sys.exit(batch_cli(sys.argv[2:]))
+
+    if not BOT_TOKEN:
+        logger.error("❌ BOT_TOKEN topilmadi!")
+        exit(1)
+
     # Portni Render'dan olish
     port = int(os.environ.get('PORT', 5000))
 
@@ -582,14 +1258,11 @@ if __name__ == '__main__':
     logger.info(f"🔑 Token length: {len(BOT_TOKEN)}")
     logger.info(f"📏 Max video size: {MAX_VIDEO_SIZE // 1024 // 1024}MB")
 
-    # Avtomatik webhook o'rnatish
-    try:
-        bot.remove_webhook()
-        time.sleep(1)
-        bot.set_webhook(url=WEBHOOK_URL)
-        logger.info("✅ Webhook set successfully!")
-    except Exception as e:
-        logger.error(f"❌ Webhook error: {e}")
+    if FAST_START:
+        # Port darhol ochiladi, /health javob beradi; bot va webhook fonda tayyorlanadi
+        threading.Thread(target=warm_up, daemon=True).start()
+    else:
+        warm_up()
 
     # Flask serverni ishga tushirish
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -9,6 +9,7 @@ from datetime import datetime
 from dotenv import load_dotenv
 import logging
 import time
+import tempfile
 
 # Logging sozlash
 logging.basicConfig(level=logging.INFO)
@@ -26,6 +27,9 @@ if not BOT_TOKEN:
 
 bot = telebot.TeleBot(BOT_TOKEN)
 
+# Max video size (150MB)
+MAX_VIDEO_SIZE = 150 * 1024 * 1024
+
 # User Agents
 USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -173,24 +177,34 @@ def handle_message(message):
         response = requests.get(video_url, headers=headers, stream=True, timeout=30)
 
         if response.status_code == 200:
-            # Temporary file in memory
-            from io import BytesIO
-            video_buffer = BytesIO()
-
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    video_buffer.write(chunk)
-
-            video_buffer.seek(0)
-
-            # Send video
-            bot.send_video(
-                message.chat.id,
-                video_buffer,
-                caption=caption[:1000] if caption else "📹 Instagram video",
-                reply_to_message_id=message.message_id,
-                supports_streaming=True
-            )
+            # Videoni xotirada emas, vaqtinchalik faylda saqlaymiz
+            video_file = tempfile.TemporaryFile(suffix='.mp4')
+            downloaded = 0
+
+            try:
+                for chunk in response.iter_content(chunk_size=8192):
+                    if chunk:
+                        downloaded += len(chunk)
+                        if downloaded > MAX_VIDEO_SIZE:
+                            bot.edit_message_text(f"❌ Video {MAX_VIDEO_SIZE // 1024 // 1024}MB dan katta",
+                                                  message.chat.id,
+                                                  progress_msg.message_id)
+                            return
+                        video_file.write(chunk)
+
+                video_file.seek(0)
+
+                # Send video
+                bot.send_video(
+                    message.chat.id,
+                    video_file,
+                    caption=caption[:1000] if caption else "📹 Instagram video",
+                    reply_to_message_id=message.message_id,
+                    supports_streaming=True
+                )
+            finally:
+                video_file.close()
+                response.close()
 
             bot.delete_message(message.chat.id, progress_msg.message_id)
 
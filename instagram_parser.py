@@ -0,0 +1,280 @@
+import re
+import json
+import html as html_lib
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Parse failure kinds
+SCHEMA_CHANGED = 'schema_changed'
+BLOCKED = 'blocked'
+LOGIN_WALL = 'login_wall'
+NOT_FOUND = 'not_found'
+NOT_VIDEO = 'not_video'
+
+LOGIN_MARKERS = ('"require_login":true', '/accounts/login', 'loginForm', 'login_and_signup_page')
+BLOCK_MARKERS = ('Please wait a few minutes', 'rate limited', 'checkpoint_required')
+
+# (method, kind) -> count, /stats orqali ko'rinadi
+parse_failures = Counter()
+_failures_lock = threading.Lock()
+
+
+class ParseError(Exception):
+    """Response could not be turned into a media record"""
+
+    def __init__(self, kind, message=""):
+        super().__init__(message or kind)
+        self.kind = kind
+
+
+class MediaInfo:
+    """Resolved Instagram video with the metadata needed for Telegram"""
+
+    __slots__ = ('shortcode', 'video_url', 'caption', 'thumbnail_url', 'thumb_url',
+                 'duration', 'width', 'height', 'owner', 'size')
+
+    def __init__(self, video_url, caption="", thumbnail_url=None, duration=None,
+                 width=None, height=None, owner=None, shortcode=None, thumb_url=None):
+        self.shortcode = shortcode
+        self.video_url = video_url
+        self.caption = caption or ""
+        self.thumbnail_url = thumbnail_url  # preview photo (large)
+        self.thumb_url = thumb_url  # send_video thumb (<= 320x320)
+        self.duration = int(round(float(duration))) if duration else None
+        self.width = int(width) if width else None
+        self.height = int(height) if height else None
+        self.owner = owner
+        self.size = None
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"MediaInfo({self.shortcode!r}, {self.video_url!r})"
+
+
+def record_failure(method, kind):
+    with _failures_lock:
+        parse_failures[(method, kind)] += 1
+
+
+def failure_stats():
+    with _failures_lock:
+        return {f"{method}:{kind}": count for (method, kind), count in parse_failures.items()}
+
+
+def classify(status, text):
+    """Failure kind for a response that did not contain a video"""
+    if status == 404:
+        return NOT_FOUND
+    if status == 429 or any(marker in text for marker in BLOCK_MARKERS):
+        return BLOCKED
+    if status in (401, 403) or any(marker in text for marker in LOGIN_MARKERS):
+        return LOGIN_WALL
+    if status != 200:
+        return BLOCKED
+    return SCHEMA_CHANGED
+
+
+# Kutilmagan JSON shakli (ro'yxat o'rniga obyekt va h.k.)
+SHAPE_ERRORS = (KeyError, IndexError, TypeError, AttributeError, ValueError)
+
+
+def extract_json_fields(text, keys):
+    """The given top-level keys of a JSON object (json.loads is C-accelerated)"""
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError("not a JSON object")
+    return {key: data[key] for key in keys if key in data}
+
+
+def pick_preview(candidates):
+    """Largest image, used for the instant preview photo"""
+    candidates = [c for c in candidates if c.get('url')]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda c: c.get('width') or 0)['url']
+
+
+def pick_thumb(candidates):
+    """Largest image that fits Telegram's 320x320 video thumb limit"""
+    fitting = [
+        c for c in candidates
+        if c.get('url') and c.get('width') and c.get('height')
+        and c['width'] <= 320 and c['height'] <= 320
+    ]
+    if not fitting:
+        return None
+    return max(fitting, key=lambda c: c['width'] * c['height'])['url']
+
+
+def parse_html_meta(html):
+    """Thumbnail and dimensions from og:* meta tags of an HTML page"""
+    meta = {}
+    fields = {
+        'og:image': 'thumbnail_url',
+        'og:video:width': 'width',
+        'og:video:height': 'height',
+    }
+    for prop, key in fields.items():
+        match = re.search(rf'<meta[^>]+property="{prop}"[^>]+content="([^"]+)"', html)
+        if match:
+            meta[key] = html_lib.unescape(match.group(1))
+    return meta
+
+
+# ==================== SCHEMAS ====================
+
+def parse_graphql(status, text):
+    """?__a=1&__d=dis JSON (new "items" and old "graphql" structures)"""
+    if status != 200 or not text.lstrip().startswith('{'):
+        raise ParseError(classify(status, text))
+
+    try:
+        fields = extract_json_fields(text, ('items', 'graphql'))
+    except ValueError:
+        raise ParseError(classify(status, text), "invalid JSON")
+
+    try:
+        media = _graphql_media(fields)
+    except SHAPE_ERRORS as e:
+        raise ParseError(SCHEMA_CHANGED, f"unexpected GraphQL shape: {e!r}")
+
+    if media is None:
+        raise ParseError(classify(status, text), "unknown GraphQL structure")
+    return media
+
+
+def _graphql_media(fields):
+    """MediaInfo from decoded top-level fields, None if no known structure"""
+
+    # New structure
+    items = fields.get('items')
+    if items:
+        item = items[0]
+        if not item.get('video_versions'):
+            raise ParseError(NOT_VIDEO)
+        video = item['video_versions'][0]
+        candidates = item.get('image_versions2', {}).get('candidates', [])
+        return MediaInfo(
+            video['url'],
+            caption=(item.get('caption') or {}).get('text', ''),
+            thumbnail_url=pick_preview(candidates),
+            thumb_url=pick_thumb(candidates),
+            duration=item.get('video_duration'),
+            width=video.get('width') or item.get('original_width'),
+            height=video.get('height') or item.get('original_height'),
+            owner=(item.get('user') or {}).get('username'),
+        )
+
+    # Old structure
+    media = (fields.get('graphql') or {}).get('shortcode_media')
+    if media:
+        if not media.get('is_video'):
+            raise ParseError(NOT_VIDEO)
+        caption = ""
+        edges = media.get('edge_media_to_caption', {}).get('edges', [])
+        if edges:
+            caption = edges[0]['node']['text']
+        resources = [
+            {'url': r.get('src'), 'width': r.get('config_width'), 'height': r.get('config_height')}
+            for r in media.get('display_resources', [])
+        ]
+        dimensions = media.get('dimensions', {})
+        return MediaInfo(
+            media.get('video_url'),
+            caption=caption,
+            thumbnail_url=media.get('display_url') or pick_preview(resources),
+            thumb_url=pick_thumb(resources),
+            duration=media.get('video_duration'),
+            width=dimensions.get('width'),
+            height=dimensions.get('height'),
+            owner=(media.get('owner') or {}).get('username'),
+        )
+
+    return None
+
+
+EMBED_VIDEO_PATTERNS = [
+    re.compile(r'src="([^"]+\.mp4[^"]*)"'),
+    re.compile(r'video_url":"([^"]+)"'),
+    re.compile(r'content="([^"]+\.mp4[^"]*)"'),
+    re.compile(r'videoSrc":"([^"]+)"'),
+]
+EMBED_THUMB_PATTERN = re.compile(r'class="EmbeddedMediaImage"[^>]+src="([^"]+)"')
+
+
+def parse_embed(status, html):
+    """/embed/captioned/ HTML page"""
+    if status == 200:
+        for pattern in EMBED_VIDEO_PATTERNS:
+            match = pattern.search(html)
+            if match:
+                video_url = match.group(1).replace('\\u0026', '&')
+                thumb_match = EMBED_THUMB_PATTERN.search(html)
+                thumbnail_url = html_lib.unescape(thumb_match.group(1)) if thumb_match else None
+                return MediaInfo(video_url, "Instagram video", thumbnail_url=thumbnail_url)
+
+        # Rasmli post embed'i - video emas
+        if EMBED_THUMB_PATTERN.search(html):
+            raise ParseError(NOT_VIDEO)
+
+    raise ParseError(classify(status, html))
+
+
+def parse_oembed(status, text):
+    """OEmbed JSON - metadata only, never a video URL"""
+    if status != 200:
+        raise ParseError(classify(status, text))
+    try:
+        data = json.loads(text)
+    except ValueError:
+        raise ParseError(classify(status, text), "oembed is not JSON")
+    try:
+        return MediaInfo(
+            None,
+            data.get('title', ''),
+            thumbnail_url=data.get('thumbnail_url'),
+            owner=data.get('author_name'),
+        )
+    except SHAPE_ERRORS as e:
+        raise ParseError(SCHEMA_CHANGED, f"unexpected oEmbed shape: {e!r}")
+
+
+DDINSTAGRAM_VIDEO_PATTERNS = [
+    re.compile(r'<video[^>]+src="([^"]+)"'),
+    re.compile(r'src="([^"]+\.mp4)"'),
+]
+
+
+def parse_ddinstagram(status, html):
+    """ddinstagram.com HTML page"""
+    if status == 200:
+        for pattern in DDINSTAGRAM_VIDEO_PATTERNS:
+            match = pattern.search(html)
+            if match:
+                return MediaInfo(match.group(1), "Instagram video", **parse_html_meta(html))
+
+    raise ParseError(classify(status, html))
+
+
+BIBLIOGRAM_VIDEO_PATTERNS = [
+    re.compile(r'<source[^>]+src="([^"]+)"'),
+    re.compile(r'src="([^"]+/video/[^"]+)"'),
+]
+
+
+def parse_bibliogram(status, html):
+    """Bibliogram HTML page"""
+    if status == 200:
+        if 'video' not in html.lower():
+            raise ParseError(NOT_VIDEO)
+        for pattern in BIBLIOGRAM_VIDEO_PATTERNS:
+            match = pattern.search(html)
+            if match:
+                return MediaInfo(match.group(1), "Instagram video", **parse_html_meta(html))
+
+    raise ParseError(classify(status, html))
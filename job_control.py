@@ -0,0 +1,313 @@
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+# ==================== RESOURCE GOVERNOR ====================
+
+class ResourceExhausted(Exception):
+    """Job could not be admitted within the configured budgets"""
+
+
+class Reservation:
+    """Capacity held by a single job, released exactly once"""
+
+    def __init__(self, governor, amounts, job=True):
+        self.governor = governor
+        self.amounts = amounts
+        self.job = job
+        self.acquired_at = time.monotonic()
+        self.released = False
+        self.handed_off = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.governor.release(self.amounts, time.monotonic() - self.acquired_at, self.job)
+
+    def __enter__(self):
+        return self
+
+    def hand_off(self, future):
+        """Keep the capacity until future is done (work that cannot be aborted)"""
+        self.handed_off = True
+        future.add_done_callback(lambda _: self.release())
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.handed_off:
+            self.release()
+
+
+class ResourceGovernor:
+    """Global admission controller for memory, scratch disk and file descriptors"""
+
+    def __init__(self, max_memory, max_disk, max_fds, max_queued, typical_job, admission_timeout=60):
+        self.limits = {'memory': max_memory, 'disk': max_disk, 'fds': max_fds}
+        self.in_use = {'memory': 0, 'disk': 0, 'fds': 0}
+        self.max_queued = max_queued
+        self.waiting = 0
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.admission_timeout = admission_timeout
+        # Load shedding taxmini uchun: odatiy job hajmi va resurs ushlab turish vaqti (EWMA)
+        self.avg_amounts = dict(typical_job)
+        self.avg_hold_time = 15.0
+        self._cond = threading.Condition()
+
+    def _fits(self, amounts):
+        return all(self.in_use[k] + v <= self.limits[k] for k, v in amounts.items())
+
+    def acquire(self, memory=0, disk=0, fds=0, timeout=None, job=True):
+        """Wait until the job fits the budgets, or raise ResourceExhausted
+
+        job=False reserves capacity for a short stage (resolve, probe, preview)
+        without counting it as a queued/running job in the load statistics.
+        """
+        amounts = {'memory': memory, 'disk': disk, 'fds': fds}
+
+        deadline = time.monotonic() + (self.admission_timeout if timeout is None else timeout)
+
+        with self._cond:
+            # Hech qachon sig'maydigan job'ni kutib o'tirmaymiz
+            if any(value > self.limits[key] for key, value in amounts.items()):
+                self.rejected += 1
+                raise ResourceExhausted("Video server resurslari uchun juda katta")
+
+            if job and not self._fits(amounts) and self.waiting >= self.max_queued:
+                self.rejected += 1
+                raise ResourceExhausted("Server band, birozdan keyin urinib ko'ring")
+
+            if job:
+                self.waiting += 1
+            try:
+                while not self._fits(amounts):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise ResourceExhausted("Server band, birozdan keyin urinib ko'ring")
+                    self._cond.wait(remaining)
+
+                for key, value in amounts.items():
+                    self.in_use[key] += value
+                if job:
+                    for key, value in amounts.items():
+                        self.avg_amounts[key] = 0.8 * self.avg_amounts[key] + 0.2 * value
+                    self.running += 1
+                    self.admitted += 1
+            finally:
+                if job:
+                    self.waiting -= 1
+
+        return Reservation(self, amounts, job)
+
+    def release(self, amounts, hold_time, job=True):
+        with self._cond:
+            for key, value in amounts.items():
+                self.in_use[key] -= value
+            if job:
+                self.running -= 1
+                self.avg_hold_time = 0.8 * self.avg_hold_time + 0.2 * hold_time
+            self._cond.notify_all()
+
+    def load(self):
+        """(running, waiting, slots, avg_hold_time) - slots: typical jobs that fit at once"""
+        with self._cond:
+            slots = min(
+                self.limits[key] // max(1, int(self.avg_amounts[key]))
+                for key in self.limits
+            )
+            return self.running, self.waiting, max(1, slots), self.avg_hold_time
+
+    def stats(self):
+        with self._cond:
+            return {
+                "memory_in_use_mb": self.in_use['memory'] // 1024 // 1024,
+                "memory_limit_mb": self.limits['memory'] // 1024 // 1024,
+                "disk_in_use_mb": self.in_use['disk'] // 1024 // 1024,
+                "disk_limit_mb": self.limits['disk'] // 1024 // 1024,
+                "fds_in_use": self.in_use['fds'],
+                "fds_limit": self.limits['fds'],
+                "running": self.running,
+                "waiting": self.waiting,
+                "avg_hold_seconds": round(self.avg_hold_time, 1),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+
+
+# ==================== DEADLINES ====================
+
+class DeadlineExceeded(Exception):
+    """Job ran out of its end-to-end time budget"""
+
+
+class Deadline:
+    """End-to-end time budget of a single job"""
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self, stage=""):
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(stage)
+
+    def timeout(self, cap, stage=""):
+        """Stage timeout: the stage's own cap limited by the remaining budget"""
+        self.check(stage)
+        return min(cap, self.remaining())
+
+
+class LoadShedder:
+    """Rejects jobs whose estimated queue wait + work would miss the deadline
+
+    The only real queue is the governor's admission queue, so the estimate is
+    built from its state: jobs holding resources, jobs waiting for them, and
+    accepted jobs that are still resolving and will join the queue.
+    """
+
+    def __init__(self, governor, deadline, admission_timeout, initial_estimate=20.0):
+        self.governor = governor
+        self.deadline = deadline
+        self.admission_timeout = admission_timeout
+        self.avg_job_time = initial_estimate
+        self.active = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def _queue(self):
+        """(jobs ahead of a new one, free slots, expected queue wait)"""
+        running, waiting, slots, avg_hold = self.governor.load()
+        # Qabul qilingan, lekin hali governor'ga yetmagan (resolve bosqichidagi) joblar
+        resolving = max(0, self.active - running - waiting)
+        ahead = waiting + resolving
+        free_slots = max(0, slots - running)
+        queue_wait = (running + ahead) // slots * avg_hold
+        return ahead, free_slots, queue_wait
+
+    def estimate(self):
+        """Expected time to finish a job accepted now"""
+        _, _, queue_wait = self._queue()
+        return queue_wait + self.avg_job_time
+
+    def try_admit(self):
+        with self._lock:
+            ahead, free_slots, queue_wait = self._queue()
+            too_slow = queue_wait + self.avg_job_time > self.deadline
+            # Governor navbati to'lib qolsa yoki kutish admission timeout'dan oshsa, job baribir rad etiladi
+            queue_full = ahead - free_slots >= self.governor.max_queued
+            if too_slow or queue_full or queue_wait > self.admission_timeout:
+                self.shed += 1
+                return False
+            self.active += 1
+            return True
+
+    def done(self, duration=None):
+        """Job finished; duration is the service time, only given for completed downloads"""
+        with self._lock:
+            self.active -= 1
+            if duration is not None:
+                # EWMA - so'nggi joblarga ko'proq vazn
+                self.avg_job_time = 0.8 * self.avg_job_time + 0.2 * duration
+
+    def stats(self):
+        with self._lock:
+            ahead, free_slots, queue_wait = self._queue()
+            return {
+                "active_jobs": self.active,
+                "jobs_ahead": ahead,
+                "free_slots": free_slots,
+                "avg_job_seconds": round(self.avg_job_time, 1),
+                "estimated_seconds": round(queue_wait + self.avg_job_time, 1),
+                "deadline_seconds": self.deadline,
+                "shed": self.shed,
+            }
+
+
+# ==================== RESOLVE CACHE ====================
+
+class ResolveCache:
+    """Shortcode -> resolved video record (TTL), with in-flight request coalescing"""
+
+    def __init__(self, fetch, ttl, negative_ttl, max_items, resolve_timeout, governor=None, fds=1):
+        self.fetch = fetch  # fetch(shortcode, deadline) -> record or None
+        self.ttl = ttl
+        self.resolve_timeout = resolve_timeout
+        self.governor = governor
+        self.fds = fds
+        self.negative_ttl = negative_ttl
+        self.max_items = max_items
+        self._items = OrderedDict()  # shortcode -> (expires_at, record or None)
+        self._inflight = {}  # shortcode -> Future
+        self._lock = threading.Lock()
+
+    def _lookup(self, shortcode):
+        entry = self._items.get(shortcode)
+        if entry is None:
+            return False, None
+        expires_at, record = entry
+        if expires_at < time.monotonic():
+            del self._items[shortcode]
+            return False, None
+        self._items.move_to_end(shortcode)
+        return True, record
+
+    def peek(self, shortcode):
+        """Cached record or None, never triggers a resolve"""
+        with self._lock:
+            return self._lookup(shortcode)[1]
+
+    def put(self, shortcode, record):
+        ttl = self.ttl if record else self.negative_ttl
+        with self._lock:
+            self._items[shortcode] = (time.monotonic() + ttl, record)
+            self._items.move_to_end(shortcode)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def resolve(self, shortcode, timeout=None):
+        """Cached record, or wait for the (shared) resolve; None if not found
+
+        timeout only limits this caller's wait. The shared resolve has its own
+        resolve_timeout budget, so one caller running out of time never fails
+        the other waiters.
+        """
+        with self._lock:
+            hit, record = self._lookup(shortcode)
+            if hit:
+                return record
+
+            future = self._inflight.get(shortcode)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[shortcode] = future
+
+        if owner:
+            threading.Thread(target=self._run, args=(shortcode, future), daemon=True).start()
+
+        return future.result(timeout)
+
+    def _run(self, shortcode, future):
+        deadline = Deadline(self.resolve_timeout)
+        try:
+            if self.governor:
+                # Resolve metodlari ketma-ket ishlaydi - bir vaqtda bitta socket
+                with self.governor.acquire(fds=self.fds, timeout=deadline.remaining(), job=False):
+                    record = self.fetch(shortcode, deadline)
+            else:
+                record = self.fetch(shortcode, deadline)
+            self.put(shortcode, record)
+            future.set_result(record)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(shortcode, None)
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,145 @@
+import os
+
+import pytest
+
+import instagram_parser
+from instagram_parser import ParseError
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def parse_error_kind(parse, status, body):
+    with pytest.raises(ParseError) as excinfo:
+        parse(status, body)
+    return excinfo.value.kind
+
+
+# ==================== GRAPHQL ====================
+
+def test_graphql_new_structure():
+    media = instagram_parser.parse_graphql(200, fixture('graphql_new.json'))
+
+    assert media.video_url == 'https://scontent.cdninstagram.com/o1/v/t16/720.mp4?efg=abc&_nc_ht=x'
+    assert media.caption == 'Sunset in Samarkand ☀️ #uzbekistan'
+    assert media.owner == 'travel.uz'
+    assert media.duration == 15
+    assert (media.width, media.height) == (720, 1280)
+    assert media.thumbnail_url.startswith('https://scontent.cdninstagram.com/v/t51/1080x1920.jpg')
+    assert media.thumb_url == 'https://scontent.cdninstagram.com/v/t51/240x240.jpg'
+
+
+def test_graphql_old_structure():
+    media = instagram_parser.parse_graphql(200, fixture('graphql_old.json'))
+
+    assert media.video_url == 'https://scontent.cdninstagram.com/v/t50/old.mp4?_nc_ht=x&oh=1'
+    assert media.caption == 'Old style post'
+    assert media.owner == 'old.account'
+    assert media.duration == 30
+    assert (media.width, media.height) == (750, 1333)
+    assert media.thumbnail_url == 'https://scontent.cdninstagram.com/v/t51/display_750.jpg'
+    # display_resources are all larger than 320x320
+    assert media.thumb_url is None
+
+
+def test_graphql_photo_is_not_video():
+    assert parse_error_kind(instagram_parser.parse_graphql, 200, fixture('graphql_photo.json')) == instagram_parser.NOT_VIDEO
+
+
+def test_graphql_ignores_nested_items():
+    body = '{"seo": {"items": [{"foo": 1}]}, "note": "\\"items\\": []", "items": [{"video_versions": [{"url": "V"}]}]}'
+    assert instagram_parser.parse_graphql(200, body).video_url == 'V'
+
+
+@pytest.mark.parametrize('body', [
+    '{"items": ["x"]}',
+    '{"items": {"a": 1}}',
+    '{"items": [{"video_versions": [{"url": "V"}], "video_duration": "abc"}]}',
+    '{"data": {"xdt_shortcode_media": null}}',
+])
+def test_graphql_unexpected_shape_is_schema_change(body):
+    assert parse_error_kind(instagram_parser.parse_graphql, 200, body) == instagram_parser.SCHEMA_CHANGED
+
+
+def test_graphql_login_wall():
+    assert parse_error_kind(instagram_parser.parse_graphql, 200, fixture('login_wall.html')) == instagram_parser.LOGIN_WALL
+
+
+def test_graphql_rate_limited():
+    assert parse_error_kind(instagram_parser.parse_graphql, 429, fixture('rate_limited.json')) == instagram_parser.BLOCKED
+
+
+def test_graphql_not_found():
+    assert parse_error_kind(instagram_parser.parse_graphql, 404, fixture('not_found.html')) == instagram_parser.NOT_FOUND
+
+
+# ==================== HTML PAGES ====================
+
+def test_embed_video():
+    media = instagram_parser.parse_embed(200, fixture('embed_video.html'))
+
+    assert media.video_url == 'https://scontent.cdninstagram.com/o1/v/t16/embed.mp4?efg=abc&_nc_ht=x'
+    assert media.thumbnail_url == 'https://scontent.cdninstagram.com/v/t51/embed_640.jpg?stp=dst-jpg&_nc_ht=x'
+    assert media.thumb_url is None
+
+
+def test_embed_photo_is_not_video():
+    assert parse_error_kind(instagram_parser.parse_embed, 200, fixture('embed_photo.html')) == instagram_parser.NOT_VIDEO
+
+
+def test_embed_login_wall():
+    assert parse_error_kind(instagram_parser.parse_embed, 200, fixture('login_wall.html')) == instagram_parser.LOGIN_WALL
+
+
+def test_oembed_metadata_only():
+    media = instagram_parser.parse_oembed(200, fixture('oembed.json'))
+
+    assert media.video_url is None
+    assert media.caption == 'Sunset in Samarkand'
+    assert media.owner == 'travel.uz'
+    assert media.thumbnail_url == 'https://scontent.cdninstagram.com/v/t51/oembed_thumb.jpg'
+
+
+def test_oembed_not_found():
+    assert parse_error_kind(instagram_parser.parse_oembed, 404, fixture('not_found.html')) == instagram_parser.NOT_FOUND
+
+
+def test_ddinstagram():
+    media = instagram_parser.parse_ddinstagram(200, fixture('ddinstagram.html'))
+
+    assert media.video_url == 'https://d.ddinstagram.com/videos/C02xYzAbCdE/1'
+    assert media.thumbnail_url == 'https://d.ddinstagram.com/images/C02xYzAbCdE/1?a=1&b=2'
+    assert (media.width, media.height) == (720, 1280)
+
+
+def test_ddinstagram_rate_limited():
+    assert parse_error_kind(instagram_parser.parse_ddinstagram, 429, '') == instagram_parser.BLOCKED
+
+
+def test_bibliogram():
+    media = instagram_parser.parse_bibliogram(200, fixture('bibliogram.html'))
+
+    assert media.video_url == 'https://bibliogram.art/videoproxy?url=https%3A%2F%2Fscontent%2Fvideo.mp4'
+    assert media.thumbnail_url == 'https://bibliogram.art/imageproxy?url=https%3A%2F%2Fscontent.jpg'
+
+
+def test_bibliogram_not_found():
+    assert parse_error_kind(instagram_parser.parse_bibliogram, 404, fixture('not_found.html')) == instagram_parser.NOT_FOUND
+
+
+# ==================== HELPERS ====================
+
+def test_extract_json_fields_skips_other_values():
+    body = ' { "a" : [1, "x]}", {"y": 2}] , "b": 3 , "c": {"d": []}} '
+    assert instagram_parser.extract_json_fields(body, ('b', 'c')) == {'b': 3, 'c': {'d': []}}
+
+
+def test_record_failure_counts_per_method_and_kind():
+    instagram_parser.record_failure('_method_test', instagram_parser.SCHEMA_CHANGED)
+    instagram_parser.record_failure('_method_test', instagram_parser.SCHEMA_CHANGED)
+
+    assert instagram_parser.failure_stats()['_method_test:schema_changed'] >= 2
@@ -0,0 +1,382 @@
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import pytest
+
+from job_control import (
+    Deadline, DeadlineExceeded, LoadShedder, ResolveCache, ResourceExhausted, ResourceGovernor
+)
+
+MB = 1024 * 1024
+
+
+def make_governor(memory=100 * MB, disk=100 * MB, fds=10, max_queued=5):
+    return ResourceGovernor(
+        memory, disk, fds, max_queued,
+        typical_job={'memory': 10 * MB, 'disk': 10 * MB, 'fds': 3},
+        admission_timeout=1
+    )
+
+
+def wait_for(condition, timeout=2):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "condition not reached"
+        time.sleep(0.005)
+
+
+def start_waiter(governor, **amounts):
+    """acquire() in a thread; returns (thread, outcome dict)"""
+    outcome = {}
+
+    def run():
+        try:
+            outcome['reservation'] = governor.acquire(**amounts)
+        except ResourceExhausted as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, outcome
+
+
+# ==================== RESOURCE GOVERNOR ====================
+
+def test_acquire_and_release_restore_budgets():
+    governor = make_governor()
+
+    with governor.acquire(memory=10 * MB, disk=20 * MB, fds=3):
+        assert governor.in_use == {'memory': 10 * MB, 'disk': 20 * MB, 'fds': 3}
+        assert governor.running == 1
+
+    assert governor.in_use == {'memory': 0, 'disk': 0, 'fds': 0}
+    assert governor.running == 0
+    assert governor.admitted == 1
+
+
+def test_release_is_idempotent():
+    governor = make_governor()
+    reservation = governor.acquire(memory=MB)
+
+    reservation.release()
+    reservation.release()
+
+    assert governor.in_use['memory'] == 0
+    assert governor.running == 0
+
+
+def test_oversize_job_is_rejected_without_waiting():
+    governor = make_governor(memory=10 * MB)
+
+    start = time.monotonic()
+    with pytest.raises(ResourceExhausted):
+        governor.acquire(memory=11 * MB, timeout=5)
+
+    assert time.monotonic() - start < 1
+    assert governor.rejected == 1
+    assert governor.waiting == 0
+
+
+def test_acquire_times_out_when_budget_stays_full():
+    governor = make_governor(fds=3)
+
+    with governor.acquire(fds=3):
+        with pytest.raises(ResourceExhausted):
+            governor.acquire(fds=1, timeout=0.05)
+
+    assert governor.rejected == 1
+    assert governor.waiting == 0
+
+
+def test_waiter_is_admitted_when_capacity_is_released():
+    governor = make_governor(fds=3)
+    holder = governor.acquire(fds=3)
+
+    thread, outcome = start_waiter(governor, fds=2, timeout=2)
+    wait_for(lambda: governor.waiting == 1)
+    assert not outcome
+
+    holder.release()
+    thread.join(2)
+
+    assert 'reservation' in outcome
+    assert governor.in_use['fds'] == 2
+    outcome['reservation'].release()
+
+
+def test_full_queue_rejects_immediately():
+    governor = make_governor(fds=3, max_queued=1)
+    holder = governor.acquire(fds=3)
+
+    thread, outcome = start_waiter(governor, fds=1, timeout=2)
+    wait_for(lambda: governor.waiting == 1)
+
+    start = time.monotonic()
+    with pytest.raises(ResourceExhausted):
+        governor.acquire(fds=1, timeout=2)
+    assert time.monotonic() - start < 1
+
+    holder.release()
+    thread.join(2)
+    outcome['reservation'].release()
+
+
+def test_hand_off_keeps_capacity_until_future_is_done():
+    governor = make_governor()
+    upload = Future()
+
+    with governor.acquire(memory=10 * MB, fds=3) as reservation:
+        reservation.hand_off(upload)
+
+    assert governor.in_use['memory'] == 10 * MB
+    assert governor.running == 1
+
+    upload.set_result(None)
+
+    assert governor.in_use == {'memory': 0, 'disk': 0, 'fds': 0}
+    assert governor.running == 0
+
+
+def test_hand_off_of_finished_future_releases_immediately():
+    governor = make_governor()
+    upload = Future()
+    upload.set_exception(RuntimeError("upload failed"))
+
+    with governor.acquire(fds=3) as reservation:
+        reservation.hand_off(upload)
+
+    assert governor.in_use['fds'] == 0
+
+
+def test_stage_reservation_is_not_counted_as_a_job():
+    governor = make_governor(fds=2, max_queued=0)
+
+    with governor.acquire(fds=1, job=False):
+        assert governor.in_use['fds'] == 1
+        assert (governor.running, governor.admitted) == (0, 0)
+
+        # max_queued only limits jobs; stages still wait for the FD budget
+        with governor.acquire(fds=1, job=False):
+            with pytest.raises(ResourceExhausted):
+                governor.acquire(fds=1, timeout=0.05, job=False)
+
+    assert governor.in_use['fds'] == 0
+    assert governor.avg_hold_time == 15.0
+    assert governor.avg_amounts['fds'] == 3
+
+
+def test_load_reports_typical_job_slots():
+    governor = make_governor(memory=100 * MB, disk=100 * MB, fds=10)
+
+    running, waiting, slots, avg_hold = governor.load()
+
+    # fds: 10 // 3 is the tightest budget
+    assert (running, waiting, slots, avg_hold) == (0, 0, 3, 15.0)
+
+
+# ==================== DEADLINES ====================
+
+def test_deadline_timeout_is_capped_by_remaining_budget():
+    deadline = Deadline(5)
+
+    assert deadline.timeout(2) == 2
+    assert 4 < deadline.timeout(60) <= 5
+
+
+def test_expired_deadline_raises_with_stage():
+    deadline = Deadline(0.01)
+    time.sleep(0.02)
+
+    assert deadline.remaining() == 0
+    with pytest.raises(DeadlineExceeded, match='upload'):
+        deadline.timeout(60, 'upload')
+
+
+def test_shedder_admits_when_idle():
+    shedder = LoadShedder(make_governor(), deadline=120, admission_timeout=60)
+
+    assert shedder.try_admit()
+    assert shedder.active == 1
+
+    shedder.done()
+    assert shedder.active == 0
+
+
+def test_shedder_rejects_job_slower_than_deadline():
+    shedder = LoadShedder(make_governor(), deadline=120, admission_timeout=60, initial_estimate=130)
+
+    assert not shedder.try_admit()
+    assert shedder.shed == 1
+
+
+def test_shedder_counts_running_jobs_as_queue_wait():
+    # fds=10 and a typical job of 3 fds -> 3 slots, all taken
+    governor = make_governor(fds=10)
+    jobs = [governor.acquire(fds=3) for _ in range(3)]
+
+    # One full round of 15s (avg hold time) before a slot frees up
+    assert not LoadShedder(governor, deadline=120, admission_timeout=10).try_admit()
+    assert LoadShedder(governor, deadline=120, admission_timeout=60).try_admit()
+
+    for job in jobs:
+        job.release()
+
+
+def test_shedder_rejects_when_governor_queue_would_overflow():
+    shedder = LoadShedder(make_governor(fds=10, max_queued=2), deadline=1000, admission_timeout=1000)
+
+    # 3 accepted jobs get a slot, the next 2 fill the governor queue
+    admitted = [shedder.try_admit() for _ in range(6)]
+
+    assert admitted == [True] * 5 + [False]
+
+
+def test_shedder_ewma_only_uses_completed_service_times():
+    shedder = LoadShedder(make_governor(), deadline=120, admission_timeout=60, initial_estimate=20)
+
+    shedder.try_admit()
+    shedder.done()
+    assert shedder.avg_job_time == 20
+
+    shedder.try_admit()
+    shedder.done(10)
+    assert shedder.avg_job_time == pytest.approx(18)
+
+
+# ==================== RESOLVE CACHE ====================
+
+class FakeFetch:
+    """Stands in for the downloader: counts calls and blocks until released"""
+
+    def __init__(self, result='record', error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.deadlines = []
+        self.release = threading.Event()
+        self.release.set()
+        self.started = threading.Event()
+
+    def __call__(self, shortcode, deadline):
+        self.calls += 1
+        self.deadlines.append(deadline)
+        self.started.set()
+        self.release.wait(2)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def make_cache(fetch, negative_ttl=60, resolve_timeout=30, governor=None):
+    return ResolveCache(fetch, 600, negative_ttl, 100, resolve_timeout, governor=governor)
+
+
+def test_concurrent_resolves_are_coalesced():
+    fetch = FakeFetch()
+    fetch.release.clear()
+    cache = make_cache(fetch)
+    results = []
+
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.resolve('abc', timeout=2)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    fetch.started.wait(2)
+    fetch.release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert results == ['record'] * 5
+    assert fetch.calls == 1
+
+
+def test_resolved_record_is_cached():
+    fetch = FakeFetch()
+    cache = make_cache(fetch)
+
+    assert cache.resolve('abc', timeout=2) == 'record'
+    assert cache.resolve('abc', timeout=2) == 'record'
+    assert cache.peek('abc') == 'record'
+    assert fetch.calls == 1
+
+
+def test_not_found_is_cached_for_negative_ttl():
+    fetch = FakeFetch(result=None)
+    cache = make_cache(fetch, negative_ttl=0.05)
+
+    assert cache.resolve('abc', timeout=2) is None
+    assert cache.resolve('abc', timeout=2) is None
+    assert fetch.calls == 1
+
+    time.sleep(0.06)
+    assert cache.resolve('abc', timeout=2) is None
+    assert fetch.calls == 2
+
+
+def test_caller_timeout_does_not_fail_other_waiters():
+    fetch = FakeFetch()
+    fetch.release.clear()
+    cache = make_cache(fetch)
+    results = []
+
+    waiter = threading.Thread(target=lambda: results.append(cache.resolve('abc', timeout=2)))
+    waiter.start()
+    fetch.started.wait(2)
+
+    # An inline query with a short budget gives up, the shared resolve goes on
+    with pytest.raises(FutureTimeout):
+        cache.resolve('abc', timeout=0.05)
+
+    fetch.release.set()
+    waiter.join(2)
+
+    assert results == ['record']
+    assert fetch.calls == 1
+
+
+def test_shared_resolve_uses_its_own_timeout():
+    fetch = FakeFetch()
+    cache = make_cache(fetch, resolve_timeout=7)
+
+    cache.resolve('abc', timeout=0.5)
+
+    assert 6 < fetch.deadlines[0].remaining() <= 7
+
+
+def test_resolve_error_reaches_waiters_and_is_not_cached():
+    fetch = FakeFetch(error=RuntimeError("network down"))
+    cache = make_cache(fetch)
+
+    with pytest.raises(RuntimeError):
+        cache.resolve('abc', timeout=2)
+
+    fetch.error = None
+    assert cache.resolve('abc', timeout=2) == 'record'
+    assert fetch.calls == 2
+
+
+def test_resolve_holds_a_stage_socket_reservation():
+    governor = make_governor(fds=2)
+    seen = []
+    cache = make_cache(lambda shortcode, deadline: seen.append(dict(governor.in_use)) or 'record', governor=governor)
+
+    assert cache.resolve('abc', timeout=2) == 'record'
+
+    assert seen[0]['fds'] == 1
+    assert governor.in_use['fds'] == 0
+    assert governor.running == 0
+
+
+def test_resolve_fails_when_no_socket_is_free():
+    governor = make_governor(fds=3)
+    fetch = FakeFetch()
+    cache = make_cache(fetch, resolve_timeout=0.05, governor=governor)
+
+    with governor.acquire(fds=3):
+        with pytest.raises(ResourceExhausted):
+            cache.resolve('abc', timeout=2)
+
+    assert fetch.calls == 0